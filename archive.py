@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Archiv für Simulationsergebnisse. Parameter, q1 bis q4 samt Unsicherheiten
+und Laufzeiten landen in einer SQLite-Datenbank, die binnierten Tallies als
+einzelne .npy-Dateien in einem Unterverzeichnis je Lauf. Dadurch lassen sich
+tausende Läufe per SQL durchsuchen und vergleichen, ohne dass Histogramme
+geladen oder Plots neu erzeugt werden müssen.
+
+Läufe mit Transmissionstabelle werden über deren Inhaltshash (response.
+table_hash) gekennzeichnet, nicht über den Pfad: eine neu berechnete Tabelle
+am selben Ort ergibt so einen anderen Eintrag. Ältere Datenbanken ohne die
+Spalten response und dose_voxels werden beim Öffnen ergänzt.
+
+Verwendung:
+    casino, timings = mc_exp.simulate(1e5, W=.99, seed=1)
+    runs = archive("archiv")
+    run_id = runs.store(casino, timings, steps=5e3, seed=1)
+    runs.query("initial_energy = ? AND W_min > ?", (0.1405, .5))
+    runs.query("response IS NULL")
+    runs.tally(run_id)["inner"]
+"""
+import os
+import sqlite3
+import datetime as dt
+import tally as tl
+
+class archive(object):
+    """
+    Variablen:
+    path: Wurzelverzeichnis des Archivs.
+    db: sqlite3-Verbindung zu path/runs.sqlite.
+    columns: Spalten der Tabelle runs, in Reihenfolge.
+
+    Funktionen:
+    store: Legt einen fertigen Lauf im Archiv ab.
+    query: Gibt Zeilen der Tabelle runs zu einer WHERE-Bedingung zurück.
+    tally: Öffnet die Tallies eines Laufs per Memory-Map.
+    compare: Stellt ausgewählte Spalten mehrerer Läufe gegenüber.
+    close: Schließt die Datenbankverbindung.
+    """
+    columns = ("id", "created", "histories", "initial_energy", "E_min",
+               "W_min", "steps", "seed", "q1", "q2", "q3", "q4", "dq1",
+               "dq2", "dq3", "dq4", "t_setup", "t_water", "t_collimator",
+               "t_lead", "t_total", "response", "dose_voxels")
+
+    def __init__(self, path="archiv"):
+        """
+        path: Verzeichnis des Archivs, wird bei Bedarf angelegt.
+        """
+        self.path = path
+        if not os.path.isdir(os.path.join(path, "tallies")):
+            os.makedirs(os.path.join(path, "tallies"))
+
+        self.db = sqlite3.connect(os.path.join(path, "runs.sqlite"))
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("""CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, created TEXT,
+            histories INTEGER, initial_energy REAL, E_min REAL, W_min REAL,
+            steps INTEGER, seed INTEGER,
+            q1 REAL, q2 REAL, q3 REAL, q4 REAL,
+            dq1 REAL, dq2 REAL, dq3 REAL, dq4 REAL,
+            t_setup REAL, t_water REAL, t_collimator REAL, t_lead REAL,
+            t_total REAL, response TEXT, dose_voxels INTEGER)""")
+        present = [row["name"] for row in
+                   self.db.execute("PRAGMA table_info(runs)")]
+        for column, kind in (("response", "TEXT"),
+                             ("dose_voxels", "INTEGER")):
+            if column not in present:
+                self.db.execute("ALTER TABLE runs ADD COLUMN {0} {1}".format(
+                    column, kind))
+        self.db.execute("""CREATE INDEX IF NOT EXISTS runs_parameters ON runs
+            (initial_energy, E_min, W_min, histories)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS runs_seed ON runs (seed)")
+        self.db.commit()
+
+    def store(self, casino, timings=None, steps=None, seed=None, tally=None):
+        """
+        casino: mc_exp-Instanz nach poll_4.
+        timings: Dictionary der Laufzeiten wie von mc_exp.simulate().
+        steps: Die für lead_length verwendete Schrittzahl.
+        seed: Der verwendete Startwert, falls bekannt.
+        tally: Bereits berechnetes Tally, default casino.tally().
+
+        Der Hash der Transmissionstabelle wird aus casino.response, die
+        Auflösung des Dosisgitters aus casino.dose übernommen.
+
+        Gibt die id des neuen Eintrags zurück.
+        """
+        if tally is None:
+            tally = casino.tally()
+        if timings is None:
+            timings = {}
+        q, dq = tl.results(tally)
+
+        row = [dt.datetime.now().isoformat(), int(casino.init_count),
+               float(casino.init_E), float(casino.particles.min_energy),
+               float(casino.particles.min_weight),
+               None if steps is None else int(steps),
+               None if seed is None else int(seed)]
+        row += [float(value) for value in q] + [float(value) for value in dq]
+        row += [timings.get(stage) for stage in
+                ("setup", "water", "collimator", "lead", "total")]
+        row += [casino.response,
+                None if casino.dose is None else casino.dose.voxels]
+
+        cursor = self.db.execute("INSERT INTO runs ({0}) VALUES ({1})".format(
+            ", ".join(self.columns[1:]), ", ".join("?"*len(row))), row)
+        run_id = cursor.lastrowid
+        tl.save(tally, os.path.join(self.path, "tallies", str(run_id)))
+        self.db.commit()
+        return run_id
+
+    def query(self, where="1", parameters=()):
+        """
+        where: SQL-Bedingung, z.B. "initial_energy = ? AND histories >= ?".
+        parameters: Werte für die Platzhalter in where.
+
+        Gibt eine Liste von sqlite3.Row zurück (Zugriff per Spaltenname).
+        """
+        return self.db.execute("SELECT * FROM runs WHERE {0} ORDER BY id".
+                               format(where), parameters).fetchall()
+
+    def tally(self, run_id, keys=None):
+        """
+        run_id: id des Laufs.
+        keys: Optionale Liste der benötigten Einträge, default alle.
+
+        Die Arrays werden nur eingeblendet, nicht eingelesen.
+        """
+        return tl.load(os.path.join(self.path, "tallies", str(run_id)),
+                       keys=keys)
+
+    def compare(self, run_ids, columns=("q1", "q2", "q3", "q4")):
+        """
+        run_ids: Liste der zu vergleichenden Läufe.
+        columns: Gewünschte Spalten, default q1 bis q4.
+
+        Gibt eine Liste von Tupeln (id, Spaltenwerte...) zurück und druckt
+        die Gegenüberstellung zusätzlich in die Konsole.
+        """
+        for column in columns:
+            if column not in self.columns:
+                raise ValueError("Unbekannte Spalte: {0}".format(column))
+        rows = [tuple(row) for row in self.db.execute(
+            "SELECT id, {0} FROM runs WHERE id IN ({1}) ORDER BY id".format(
+                ", ".join(columns), ", ".join("?"*len(run_ids))),
+            list(run_ids)).fetchall()]
+
+        print("\t".join(("id",) + tuple(columns)))
+        for row in rows:
+            print("\t".join(str(value) for value in row))
+        return rows
+
+    def close(self):
+        """
+        Schließt die Datenbankverbindung.
+        """
+        self.db.close()
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Zwischenspeicher für komplette Läufe. Identische Konfigurationen werden
+nicht erneut gerechnet, sondern das gespeicherte Tally zurückgegeben.
+
+Der Schlüssel ist ein SHA-256 über alle Argumente von mc_exp.simulate()
+(inklusive Standardwerten und Startwert) sowie über den Inhalt der Wirkungs-
+querschnittstabellen und der Quelltexte von mc_exp.py, interpolate.py,
+dose.py und response.py, bei Verwendung einer Transmissionstabelle auch über
+deren beim Speichern abgelegten Inhaltshash (response.table_hash).
+Da die Geometrie (Kugelradius, Kollimator, Detektor) fest im Quelltext
+steht, ändert sich der Schlüssel auch bei jeder Änderung daran.
+
+Einträge werden erst unter temporärem Namen geschrieben und dann per
+os.rename an ihren Platz gelegt, Leser sehen also nie halbe Einträge.
+Das Aufräumen (LRU nach Größe) läuft unter einer Dateisperre, sodass
+mehrere Prozesse denselben Cache gleichzeitig verwenden können. Reste
+abgebrochener Schreib- oder Löschvorgänge (.tmp-*, .del-*) zählen zur
+Größe und werden nach stale_seconds entfernt.
+
+Verwendung:
+    runs = run_cache("cache", max_bytes=5e9)
+    tally = runs.run(1e5, W=.99, seed=1)
+"""
+import os
+import json
+import time
+import fcntl
+import shutil
+import inspect
+import hashlib
+import tempfile
+import mc_exp as mc
+import interpolate as ip
+import dose as ds
+import response as rs
+import tally as tl
+
+XSECT_FILES = ("CrossSectWasser.txt", "CrossSectBlei.txt")
+
+def file_hash(path):
+    """
+    Gibt den SHA-256 (hex) des Dateiinhalts zurück.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def source_file(module):
+    """
+    Pfad zur .py-Datei eines Moduls, auch wenn es aus .pyc geladen wurde.
+    """
+    path = inspect.getsourcefile(module)
+    return path if path else module.__file__
+
+class run_cache(object):
+    """
+    Variablen:
+    path: Verzeichnis des Caches.
+    max_bytes: Obergrenze für die Gesamtgröße aller Einträge.
+    stale_seconds: Alter, ab dem liegengebliebene .tmp-/.del-Verzeichnisse
+        gelöscht werden.
+
+    Funktionen:
+    parameters: Vervollständigt und normiert die Argumente für simulate().
+    key: Berechnet den Schlüssel zu einer Konfiguration.
+    get: Gibt das Tally zu einem Schlüssel zurück, sonst None.
+    put: Legt ein Tally unter einem Schlüssel ab.
+    evict: Löscht die am längsten unbenutzten Einträge bis max_bytes.
+    run: get, bei Fehlschlag simulate() und put.
+    """
+
+    def __init__(self, path="cache", max_bytes=1e9, stale_seconds=3600.):
+        """
+        path: Verzeichnis des Caches, wird bei Bedarf angelegt.
+        max_bytes: Größenlimit in Byte, default 1e9
+        stale_seconds: Siehe oben, default eine Stunde.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+
+    def parameters(self, *args, **kwargs):
+        """
+        Nimmt dieselben Argumente wie mc_exp.simulate() entgegen, ergänzt
+        fehlende Standardwerte und bringt Zahlen in eine eindeutige Form, so
+        dass z.B. 1e5 und 100000 zum selben Schlüssel führen.
+        """
+        spec = inspect.getargspec(mc.simulate)
+        params = dict(zip(spec.args[-len(spec.defaults):], spec.defaults))
+        params.update(zip(spec.args, args))
+        params.update(kwargs)
+
+        params["number_of_particles"] = int(params["number_of_particles"])
+        for name in ("initial_energy", "E", "W", "steps"):
+            params[name] = float(params[name])
+        for name in ("seed", "dose_voxels"):
+            if params[name] is not None:
+                params[name] = int(params[name])
+        return params
+
+    def key(self, params):
+        """
+        params: Von parameters() zurückgegebenes Dictionary.
+
+        Die Experimentklasse geht über Namen und Quelltext ihres Moduls ein,
+        die Transmissionstabelle nur über ihren Inhaltshash, nicht über den
+        Pfad.
+        """
+        described = dict(params)
+        experiment = described.pop("experiment")
+        described["experiment"] = experiment.__module__ + "." + \
+            experiment.__name__
+
+        hashes = dict((name, file_hash(name)) for name in XSECT_FILES)
+        for module in (mc, ip, ds, rs, inspect.getmodule(experiment)):
+            hashes[module.__name__] = file_hash(source_file(module))
+        if described["response"] is not None:
+            described["response"] = rs.table_hash(described["response"])
+
+        canonical = json.dumps({"parameters": described, "files": hashes},
+                               sort_keys=True)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        key: Schlüssel wie von key() berechnet.
+
+        Gibt das Tally (eingelesen, nicht eingeblendet, damit späteres
+        Aufräumen den Aufrufer nicht stört) zurück oder None. Ein Treffer
+        aktualisiert den Zeitstempel des Eintrags für das LRU-Aufräumen.
+        """
+        entry = os.path.join(self.path, key)
+        try:
+            tally = tl.load(entry, mmap=False)
+            os.utime(entry, None)
+        except (OSError, IOError):
+            return None
+        return tally
+
+    def put(self, key, tally, params=None):
+        """
+        key: Schlüssel
+        tally: Zu speicherndes Tally.
+        params: Optional, wird zur Information als parameters.json abgelegt.
+
+        Existiert der Eintrag bereits (anderer Prozess war schneller), wird
+        der eigene verworfen.
+        """
+        staging = tempfile.mkdtemp(prefix=".tmp-", dir=self.path)
+        tl.save(tally, staging)
+        if params is not None:
+            described = dict(params)
+            described["experiment"] = described["experiment"].__name__
+            with open(os.path.join(staging, "parameters.json"), "w") as meta:
+                json.dump(described, meta, sort_keys=True)
+        try:
+            os.rename(staging, os.path.join(self.path, key))
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """
+        Löscht zuerst veraltete .tmp-/.del-Verzeichnisse, dann die am
+        längsten nicht verwendeten Einträge, bis die Gesamtgröße (inklusive
+        noch laufender Schreibvorgänge) unter max_bytes liegt. Einträge werden
+        vor dem Löschen umbenannt, damit gleichzeitige Leser sie nicht halb
+        gelöscht sehen.
+        """
+        with open(os.path.join(self.path, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            total = 0
+            now = time.time()
+            for name in os.listdir(self.path):
+                entry = os.path.join(self.path, name)
+                if not os.path.isdir(entry):
+                    continue
+                try:
+                    modified = os.path.getmtime(entry)
+                    size = sum(os.path.getsize(os.path.join(entry, part))
+                               for part in os.listdir(entry))
+                except OSError:
+                    continue
+                if name.startswith("."):
+                    if now - modified > self.stale_seconds:
+                        shutil.rmtree(entry, ignore_errors=True)
+                    else:
+                        total += size
+                    continue
+                entries.append((modified, size, name))
+                total += size
+
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                doomed = os.path.join(self.path, ".del-{0}-{1}".format(
+                    name, time.time()))
+                os.rename(os.path.join(self.path, name), doomed)
+                shutil.rmtree(doomed, ignore_errors=True)
+                total -= size
+
+    def run(self, *args, **kwargs):
+        """
+        Nimmt dieselben Argumente wie mc_exp.simulate() entgegen und gibt
+        das Tally des Laufs zurück. Ohne Startwert ist das Ergebnis nicht
+        reproduzierbar, dann wird immer gerechnet und nichts gespeichert.
+        """
+        params = self.parameters(*args, **kwargs)
+        if params["seed"] is None:
+            return mc.simulate(**params)[0].tally()
+
+        key = self.key(params)
+        tally = self.get(key)
+        if tally is None:
+            tally = mc.simulate(**params)[0].tally()
+            self.put(key, tally, params)
+        return tally
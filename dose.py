@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Räumliche Verteilung der in der Wasserkugel deponierten Energie. Das Gitter
+ist ein Würfel der Kantenlänge 2*radius um den Ursprung, aufgeteilt in
+voxels^3 gleich große Voxel. Bewertet wird bei jedem Wechselwirkungsschritt
+die abgegebene Energie mal Gewicht am Ort der Wechselwirkung: der Compton-
+Energieübertrag, der durch Photoabsorption verlorene Gewichtsanteil sowie
+die Restenergie von Teilchen, die wegen Mindestenergie oder Mindestgewicht
+gelöscht werden.
+
+Das Aufsummieren geschieht vektorisiert über flache Voxelindizes und
+np.bincount. Der Speicherbedarf hängt nur von der Auflösung ab (8 Byte je
+Voxel), nicht von der Zahl der Historien; für große Gitter wird über voxels
+gröber aufgelöst. Eine dünnbesetzte Speicherung lohnt nicht, da sich bei
+einer Quelle im Kugelmittelpunkt schnell der Großteil der Voxel füllt.
+"""
+import numpy as np
+
+MEV_TO_J = 1.602176634e-13
+WATER_KG_PER_MM3 = 1e-6
+
+class dose_grid(object):
+    """
+    Variablen:
+    voxels: Anzahl Voxel je Achse.
+    radius: Halbe Kantenlänge des Gitters (mm), default Kugelradius 100.
+    size: Kantenlänge eines Voxels (mm).
+    grid: Flaches Gitter mit voxels^3 Einträgen (MeV).
+
+    Funktionen:
+    score: Addiert Energiebeiträge an gegebenen Orten.
+    merge: Addiert ein anderes Gitter gleicher Auflösung.
+    dense: Gibt das Gitter als (voxels,voxels,voxels)-Array zurück.
+    gray: Wie dense, aber als Dosis (Gy) pro Historie.
+    tally: Einträge für das Tally-Dictionary, siehe Modul tally.
+    """
+
+    def __init__(self, voxels=50, radius=100.):
+        """
+        voxels: Anzahl Voxel je Achse, default 50 (4 mm Kantenlänge).
+        radius: Halbe Kantenlänge des Gitters in mm, default 100.
+        """
+        self.voxels = int(voxels)
+        self.radius = float(radius)
+        self.size = 2*self.radius/self.voxels
+        self.grid = np.zeros(self.voxels**3)
+
+    def score(self, coords, energy):
+        """
+        coords: (n,3)-Array der Wechselwirkungsorte.
+        energy: n deponierte Energien (MeV), bereits mit Gewicht multipli-
+            ziert.
+
+        Beiträge außerhalb des Gitters werden verworfen.
+        """
+        cell = np.floor((coords + self.radius)/self.size).astype(np.int64)
+        inside = np.all((cell >= 0) * (cell < self.voxels), axis=1)
+        flat = np.ravel_multi_index(tuple(cell[inside].T),
+                                    (self.voxels,)*3)
+        self.grid += np.bincount(flat, weights=energy[inside],
+                                 minlength=self.grid.size)
+
+    def merge(self, other):
+        """
+        other: dose_grid gleicher Auflösung, etwa aus einem anderen Batch.
+        """
+        if (other.voxels, other.radius) != (self.voxels, self.radius):
+            raise ValueError("Dosisgitter unterschiedlicher Auflösung.")
+        self.grid += other.grid
+
+    def dense(self):
+        """
+        Gibt die deponierte Energie (MeV) je Voxel als 3D-Array zurück.
+        """
+        return np.reshape(self.grid, (self.voxels,)*3)
+
+    def gray(self, histories):
+        """
+        histories: Anzahl simulierter Historien.
+
+        Rechnet auf Dosis (Gy) pro Historie um, unter der Annahme, dass
+        jedes Voxel vollständig mit Wasser gefüllt ist. Für Voxel am Kugel-
+        rand ist das nur eine Näherung.
+        """
+        mass = self.size**3 * WATER_KG_PER_MM3
+        return self.dense() * MEV_TO_J / mass / histories
+
+    def tally(self):
+        """
+        Gibt die Einträge zurück, die mc_exp.tally() übernimmt: das Gitter
+        als "dose" und die Gittergrenzen als "dose_edges".
+        """
+        return {"dose": self.dense().copy(),
+                "dose_edges": np.linspace(-self.radius, self.radius,
+                                          self.voxels + 1)}
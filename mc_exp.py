@@ -54,7 +54,22 @@ class interpolate(object):
                              self.data[:,1])
 
 import interpolate as ip
+import dose as ds
 import matplotlib.pyplot as plt
+import datetime as dt
+import time
+
+def between_septa(position):
+    """
+    position: Array mit y- oder z-Koordinaten (mm).
+
+    Prüft für eine Querkoordinate, ob sie zwischen zwei Bleisepten liegt.
+    Ein Teilchen ist genau dann in Luft, wenn das für y und z gilt. Da die
+    Septen symmetrisch um die Vielfachen von 3 mm liegen, ist das Ergebnis
+    streng periodisch in position.
+    """
+    scaled_pos = np.abs(position) % 3
+    return (scaled_pos > 0.25) * (scaled_pos < 2.75)
 
 class particles(object):
     """
@@ -67,6 +82,9 @@ class particles(object):
     Instanzvariablen:
     coords: Globaler Ortsvektor
     count: Anzahl an Teilchen, die aktuell von Interesse sind.
+    deposit: Optionale Funktion deposit(coords, energy), die bei jeder
+        Wechselwirkung die deponierte Energie mal Gewicht am Wechselwirkungs-
+        ort erhält, z.B. dose_grid.score. Default None.
     direction: Globaler Richtungsvektor
     energy: Teilchenenergie
     min_energy: Teilchen mit Energie (MeV) unter diesem Wert werden gelöscht
@@ -133,6 +151,7 @@ class particles(object):
         self.properties.remove("count")
         self.min_energy = E_min
         self.min_weight = W_min
+        self.deposit = None
 
 
     def interact(self,particle_mask = None):
@@ -148,6 +167,11 @@ class particles(object):
         entsprechend angepasst. Je nach Wert für das Mindestgewicht bedeu-
         tet dies sofortige Absorption oder Überleben mit neuem Gewicht.
 
+        Ist self.deposit gesetzt, werden der absorbierte Gewichtsanteil, der
+        Compton-Energieübertrag und die Restenergie der anschließend von
+        cleanup gelöschten Teilchen dorthin gemeldet, jeweils am Ort der
+        Wechselwirkung.
+
         Ruft Funktionen in Reihenfolge
             get_angles
             get_direction
@@ -163,11 +187,25 @@ class particles(object):
 
         photo_mask = (np.random.rand(len(particle_mask)) < self.p_photo) * \
             particle_mask
+        if self.deposit is not None:
+            self.deposit(self.coords[photo_mask], self.weight[photo_mask] *
+                self.p_photo[photo_mask] * self.energy[photo_mask])
         self.weight[photo_mask] *= (1-self.p_photo[photo_mask])
 
         self.get_angles(particle_mask)
         self.get_direction(particle_mask)
-        self.E_scatter(particle_mask)
+        if self.deposit is None:
+            self.E_scatter(particle_mask)
+        else:
+            energy_before = self.energy[particle_mask]
+            self.E_scatter(particle_mask)
+            self.deposit(self.coords[particle_mask],
+                (energy_before - self.energy[particle_mask]) *
+                self.weight[particle_mask])
+            dropped = np.logical_not((self.energy > self.min_energy) *
+                (self.weight > self.min_weight))
+            self.deposit(self.coords[dropped],
+                self.weight[dropped] * self.energy[dropped])
         self.move(particle_mask)
         self.cleanup()
 
@@ -358,6 +396,16 @@ class mc_exp(object):
         Kollimator.
     lead_thickness: Die aus lead_ratio und colpath_val berechnete durchflogene
         Bleidicke.
+    sums: Summe der Beiträge aller Historien zu q1 bis q4 (Gewicht bzw. 1).
+    sumsq: Summe der quadrierten Beiträge, für die statistische Unsicherheit.
+    dose: Optionales dose_grid für die in der Wasserkugel deponierte
+        Energie, default None.
+    response: Inhaltshash der in poll_4 verwendeten Transmissionstabelle,
+        default None (lead_length).
+
+    Klassenvariablen:
+    particle_type: Klasse der erzeugten Teilchen, default particles. Kann in
+        Unterklassen ersetzt werden.
 
     Instanzen:
     water: interpolate-Instanz mit Wasserdaten.
@@ -386,9 +434,13 @@ class mc_exp(object):
     poll_1 bis 4: Sollen Fragen 1 bis 4 beantworten.
     plot: gibt die Energiespektren sowie die räumliche Verteilung der Photonen
         auf dem Detektor aus.
+    tally: Fasst Trefferzahlen und Histogramme mit festen Bingrenzen in einem
+        Dictionary zusammen, siehe Modul tally.
 
 
     """
+    particle_type = particles
+
     def __init__(self, number_of_particles=1e5, initial_energy=0.1405, E=1e-3,
             W=1e-2):
         """
@@ -411,7 +463,8 @@ class mc_exp(object):
         self.init_E = initial_energy
         self.init_count = number_of_particles
 
-        self.particles = particles(number_of_particles,self.init_E,E,W)
+        self.particles = self.particle_type(number_of_particles,self.init_E,
+                                            E,W)
 
         self.water = ip.interpolate("CrossSectWasser.txt",.1)
         self.water.set_name(1,"scatter")
@@ -420,6 +473,10 @@ class mc_exp(object):
         self.lead.set_name(1,"photo")
 
         self.water_mask = np.ones(self.init_count,dtype=bool)
+        self.sums = np.zeros(4)
+        self.sumsq = np.zeros(4)
+        self.dose = None
+        self.response = None
 
         self.update_xsect()
         self.initial_move()
@@ -516,9 +573,12 @@ class mc_exp(object):
         self.particles.coords += np.reshape((200 - self.particles.coords[:,0])/
             self.particles.direction[:,0],(-1,1)) * self.particles.direction
 
-        self.colhit_ratio = np.sum(self.particles.weight[(np.absolute(
+        colhit_weight = self.particles.weight[(np.absolute(
             self.particles.coords[:,1]) < 150.25) *
-            (np.absolute(self.particles.coords[:,2]) < 150.25)])/self.init_count
+            (np.absolute(self.particles.coords[:,2]) < 150.25)]
+        self.colhit_ratio = np.sum(colhit_weight)/self.init_count
+        self.sums[2] = np.sum(colhit_weight)
+        self.sumsq[2] = np.sum(colhit_weight**2)
 
         self.particles.coords += np.reshape((235 - self.particles.coords[:,0])/
             self.particles.direction[:,0],(-1,1)) * self.particles.direction
@@ -575,10 +635,8 @@ class mc_exp(object):
         Das Kollimatorraster hat eine "Wiederholrate" von 3 cm, daher wird
         mod3 verwendet um die Prüfung leichter handhabbar zu machen.
         """
-        scaled_pos = np.abs(self.current_pos[:,1::]) % 3
-        y = (scaled_pos[:,0] > 0.25) * (scaled_pos[:,0] < 2.75)
-        z = (scaled_pos[:,1] > 0.25) * (scaled_pos[:,1] < 2.75)
-        return np.logical_not(y * z)
+        return np.logical_not(between_septa(self.current_pos[:,1]) *
+                              between_septa(self.current_pos[:,2]))
 
 
     def poll_1(self):
@@ -586,11 +644,12 @@ class mc_exp(object):
         Sammelt Daten für Aufgabe a) und gibt die entsprechende Prozentzahl
         aus.
         """
-        self.q1 = np.round(np.sum((np.abs(
+        self.sums[0] = self.sumsq[0] = np.sum((np.abs(
         self.particles.coords[:,1]) < self.particles.coords[:,0] * (150.25/200))
             * (np.abs(self.particles.coords[:,2]) <
             self.particles.coords[:,0]*(150.25/200)) *
-            (self.particles.coords[:,0] > 0))/self.init_count*100,2)
+            (self.particles.coords[:,0] > 0))
+        self.q1 = np.round(self.sums[0]/self.init_count*100,2)
 
         print("Initial in Raumwinkel emittierte Photonen: {0}%".
             format(self.q1))
@@ -600,7 +659,9 @@ class mc_exp(object):
         Sammelt Daten für Aufgabe b) und gibt die entsprechende Prozentzahl
         aus.
         """
-        self.q2 = np.round(np.sum(self.particles.weight)/self.init_count*100,2)
+        self.sums[1] = np.sum(self.particles.weight)
+        self.sumsq[1] = np.sum(self.particles.weight**2)
+        self.q2 = np.round(self.sums[1]/self.init_count*100,2)
         print("Anteil an Photonen die die Wasserkugel verlassen: {0}%".
             format(self.q2))
 
@@ -613,14 +674,24 @@ class mc_exp(object):
         print("Anteil an Photonen die auf Kollimator auftreffen: {0}%".
             format(self.q3))
 
-    def poll_4(self):
+    def poll_4(self, table=None):
         """
+        table: Optionale response_table (siehe response.py), default None.
+
         Sammelt Daten für Aufgabe d) und gibt die entsprechende Prozentzahl
-        aus.
+        aus. Mit table wird statt lead_length und Auswürfeln der freien Weg-
+        länge die tabellierte Transmissionswahrscheinlichkeit als Gewicht
+        verwendet, survivors enthält dann diese Gewichte.
         """
-        self.survivors = (self.lead_thickness < self.particles.mean_free()).\
-            flatten()
-        self.q4 = np.round(np.sum(self.survivors)/self.init_count*100,2)
+        if table is None:
+            self.survivors = (self.lead_thickness <
+                self.particles.mean_free()).flatten()
+        else:
+            self.survivors = table.lookup(self.particles.total_x,
+                self.over_coll, self.colpath_dir)
+        self.sums[3] = np.sum(self.survivors)
+        self.sumsq[3] = np.sum(self.survivors**2)
+        self.q4 = np.round(self.sums[3]/self.init_count*100,2)
         print("Anteil an Photonen die sowohl durch Kollimator gelangen als "\
             "auch auf Detektor auftreffen: {0}%".format(self.q4))
 
@@ -639,45 +710,137 @@ class mc_exp(object):
         plt.ylabel("z-Position")
         plt.savefig("distribution.png")
 
-        self.inner = (np.sqrt(np.sum(self.particles.coords[:,1::]**2,1)) < 40)\
-            * self.survivors
+        # survivors enthält im Tabellenmodus Transmissionswahrscheinlich-
+        # keiten, daher als Gewichte statt als Maske
+        passed = self.survivors.astype(float)
+        self.inner = (np.sqrt(np.sum(self.particles.coords[:,1::]**2,1)) < 40)
         plt.figure()
-        plt.hist(self.particles.energy[self.inner]*1e3,bins=50)
+        plt.hist(self.particles.energy[self.inner]*1e3,bins=50,
+                 weights=passed[self.inner])
         plt.title("Spektrum in 4 cm Radius")
         plt.xlabel("E / keV")
         plt.ylabel("Anzahl")
         plt.savefig("inner.png")
 
         plt.figure()
-        plt.hist(self.particles.energy[np.logical_not(self.inner)]*1e3,bins=50)
+        plt.hist(self.particles.energy[np.logical_not(self.inner)]*1e3,bins=50,
+                 weights=passed[np.logical_not(self.inner)])
         plt.title("Spektrum ausserhalb")
         plt.xlabel("E / keV")
         plt.ylabel("Anzahl")
         plt.savefig("outer.png")
 
 
-"""
-Und los gehts, alles aufrufen und starten! Wohoooo!
-"""
-#import mc_exp as mc
-import datetime as dt
-
-print("Beginne Simulation um {0}, erzeuge Startarrays...".
-    format(dt.datetime.now()))
-casino = mc_exp(1e5, W=.99)
-casino.poll_1()
-
-print("Beginne Bewegung in Wasser, Fortschritt\n0%")
-casino.out_of_water()
 
-casino.poll_2()
-casino.cull_particles()
-casino.move_to_coll()
-casino.poll_3()
-
-casino.lead_length(5e3)
-
-casino.poll_4()
-casino.plot()
-
-print("Simulation fertig um {0}".format(dt.datetime.now()))
\ No newline at end of file
+    def tally(self, spectrum_bins=50, detector_bins=100):
+        """
+        spectrum_bins: Anzahl Energiebins der Spektren, default 50
+        detector_bins: Anzahl Bins je Achse der Detektorverteilung, default 100
+
+        Im Gegensatz zu plot() werden feste Bingrenzen verwendet (0 bis
+        Anfangsenergie bzw. Kollimatorfläche), damit sich die Histogramme
+        verschiedener Läufe direkt vergleichen und aufsummieren lassen.
+        Innen und außen beziehen sich hier beide nur auf Teilchen, die den
+        Kollimator passieren. Ist self.dose gesetzt, kommen dessen Einträge
+        hinzu. Muss nach poll_4 aufgerufen werden.
+
+        Gibt ein Dictionary im Format des Moduls tally zurück.
+        """
+        energy_edges = np.linspace(0, self.init_E*1e3, spectrum_bins + 1)
+        detector_edges = np.linspace(-150.25, 150.25, detector_bins + 1)
+
+        radius = np.sqrt(np.sum(self.particles.coords[:,1::]**2,1))
+        passed = self.survivors.astype(float)
+        inner_weight = passed * (radius < 40)
+        outer_weight = passed * (radius >= 40)
+        energy = self.particles.energy*1e3
+
+        tally = {
+            "histories": np.array(self.init_count, dtype=float),
+            "sums": self.sums.copy(),
+            "sumsq": self.sumsq.copy(),
+            "detector": np.histogram2d(self.particles.coords[:,1],
+                self.particles.coords[:,2], bins=detector_edges)[0],
+            "inner": np.histogram(energy, energy_edges,
+                weights=inner_weight)[0],
+            "inner_sq": np.histogram(energy, energy_edges,
+                weights=inner_weight**2)[0],
+            "outer": np.histogram(energy, energy_edges,
+                weights=outer_weight)[0],
+            "outer_sq": np.histogram(energy, energy_edges,
+                weights=outer_weight**2)[0],
+            "energy_edges": energy_edges,
+            "detector_edges": detector_edges}
+        if self.dose is not None:
+            tally.update(self.dose.tally())
+        return tally
+
+
+def simulate(number_of_particles=1e5, initial_energy=0.1405, E=1e-3, W=1e-2,
+             steps=5e3, seed=None, experiment=mc_exp, dose_voxels=None,
+             response=None):
+    """
+    number_of_particles, initial_energy, E, W: Siehe mc_exp.__init__
+    steps: Schrittzahl für lead_length, default 5e3
+    seed: Startwert für np.random, default None (nicht reproduzierbar)
+    experiment: Zu verwendende Klasse, default mc_exp. Erlaubt es, eine
+        Unterklasse mit alternativen (z.B. beschleunigten) Methoden einzu-
+        setzen, siehe validate.py.
+    dose_voxels: Voxel je Achse für ein Dosisgitter über der Wasserkugel,
+        default None (keine Dosisberechnung).
+    response: Pfad einer mit response.py erzeugten Transmissionstabelle.
+        Ist er gesetzt, entfällt lead_length und poll_4 wertet per Tabelle
+        aus; der Inhaltshash der Tabelle landet in casino.response. Default
+        None.
+
+    Führt das komplette Experiment in der üblichen Reihenfolge aus, ohne zu
+    plotten. Gibt die mc_exp-Instanz sowie ein Dictionary mit den Laufzeiten
+    (Sekunden) der einzelnen Abschnitte zurück.
+    """
+    if seed is not None:
+        np.random.seed(seed)
+
+    timings = {}
+    start = time.time()
+    casino = experiment(int(number_of_particles), initial_energy, E, W)
+    if dose_voxels is not None:
+        casino.dose = ds.dose_grid(dose_voxels)
+        casino.particles.deposit = casino.dose.score
+    casino.poll_1()
+    timings["setup"] = time.time() - start
+
+    print("Beginne Bewegung in Wasser, Fortschritt\n0%")
+    lap = time.time()
+    casino.out_of_water()
+    casino.poll_2()
+    timings["water"] = time.time() - lap
+
+    lap = time.time()
+    casino.cull_particles()
+    casino.move_to_coll()
+    casino.poll_3()
+    timings["collimator"] = time.time() - lap
+
+    lap = time.time()
+    if response is None:
+        casino.lead_length(steps)
+        casino.poll_4()
+    else:
+        # Erst hier importiert, da response.py selbst auf mc_exp aufbaut.
+        import response as rs
+        casino.poll_4(rs.load(response))
+        casino.response = rs.table_hash(response)
+    timings["lead"] = time.time() - lap
+    timings["total"] = time.time() - start
+
+    return casino, timings
+
+
+if __name__ == "__main__":
+    # Und los gehts, alles aufrufen und starten! Wohoooo!
+    print("Beginne Simulation um {0}, erzeuge Startarrays...".
+        format(dt.datetime.now()))
+    casino, timings = simulate(1e5, W=.99)
+    casino.plot()
+
+    print("Simulation fertig um {0}".format(dt.datetime.now()))
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Vorberechnete Transmissionstabelle des Bleikollimators als schneller Ersatz
+für lead_length. Die im Blei zurückgelegte Strecke hängt nur von der Richtung
+(Tangens gegenüber der x-Achse in y und z) und von der Eintrittsposition
+modulo Rasterweite ab, die Transmission zusätzlich vom Schwächungskoeffi-
+zienten. Tabelliert wird daher
+
+    T[mu, tan_y, tan_z, y mod 3, z mod 3] = <exp(-mu * Bleidicke)>,
+
+gemittelt über mehrere Stützstellen je Zelle. Als Energieachse dient direkt
+der Schwächungskoeffizient (1/mm), da poll_4 mit dem Wirkungsquerschnitt
+rechnet, der zu diesem Zeitpunkt in particles.total_x steht. Damit gilt die
+Tabelle unabhängig davon, welche Querschnittsdaten dort landen.
+
+Die Bleidicke wird wie in lead_length diskretisiert und mit derselben
+Septenprüfung (mc_exp.between_septa) bestimmt. Da die Prüfung in y und z
+getrennt erfolgt, reduziert sich das Zählen der Luftschritte aller Kombi-
+nationen auf ein Matrixprodukt.
+
+Aufruf:
+    python response.py -o kollimator
+    mc_exp.simulate(1e5, W=.99, response="kollimator")
+"""
+import os
+import hashlib
+import argparse
+import numpy as np
+import mc_exp as mc
+import tally as tl
+
+# Untergrenze für T vor dem Logarithmieren (float32 läuft sonst auf 0)
+TINY = 1e-30
+
+class response_table(object):
+    """
+    Variablen:
+    mu: Logarithmisch verteilte Stützstellen des Schwächungskoeffizienten.
+    transmission: Tabelle wie oben beschrieben.
+    tan_max: Tabellierter Bereich der Tangenten, -tan_max bis tan_max.
+    pitch: Rasterweite des Kollimators (mm).
+
+    Funktionen:
+    lookup: Transmissionswahrscheinlichkeit für eine Menge von Teilchen.
+    digest: SHA-256 über Stützstellen, Tabelle und Geometrie.
+    save: Schreibt die Tabelle als Verzeichnis von .npy-Dateien.
+    """
+
+    def __init__(self, mu, transmission, tan_max, pitch=3.):
+        self.mu = np.asarray(mu)
+        self.transmission = transmission
+        self.tan_max = float(tan_max)
+        self.pitch = float(pitch)
+
+    def lookup(self, mu, over_coll, direction):
+        """
+        mu: Schwächungskoeffizienten (1/mm) der Teilchen.
+        over_coll: Ortsvektoren an der Kollimatoroberseite.
+        direction: Richtungsvektoren der Teilchen.
+
+        Richtung und Position werden auf die nächste Zelle abgebildet.
+        Zwischen den mu-Stützstellen wird log(T) linear in mu interpoliert:
+        für eine einzelne Bleidicke ist das exakt, für die Mittelung über
+        eine Zelle (konvex in mu) ein kleiner Fehler. Lineare Interpolation
+        von T selbst würde die Transmission bei stark schwächendem Blei
+        deutlich überschätzen. Unterhalb der ersten Stützstelle wird gegen
+        T(0) = 1 interpoliert, oberhalb der letzten der Randwert verwendet,
+        ebenso für Tangenten außerhalb des tabellierten Bereichs.
+        Gibt ein Array mit Transmissionswahrscheinlichkeiten zurück.
+        """
+        n_mu, n_tan, _, n_pos, _ = self.transmission.shape
+        tangent = direction[:,1::]/np.reshape(direction[:,0], (-1,1))
+        tan_index = np.clip(np.floor((tangent + self.tan_max) /
+            (2*self.tan_max/n_tan)), 0, n_tan - 1).astype(int)
+        pos_index = np.clip(np.floor(np.mod(over_coll[:,1::], self.pitch) /
+            (self.pitch/n_pos)), 0, n_pos - 1).astype(int)
+
+        # mu = 0 ist implizit Stützstelle mit T = 1
+        grid = np.concatenate(([0.], self.mu))
+        mu = np.clip(np.ravel(mu), 0, grid[-1])
+        upper = np.clip(np.searchsorted(grid, mu, side="right"), 1, n_mu)
+        lower = upper - 1
+        fraction = (mu - grid[lower])/(grid[upper] - grid[lower])
+
+        cell = (tan_index[:,0], tan_index[:,1], pos_index[:,0],
+                pos_index[:,1])
+        below = np.where(lower > 0, np.log(np.maximum(self.transmission[
+            (np.maximum(lower - 1, 0),) + cell], TINY)), 0)
+        above = np.log(np.maximum(self.transmission[(upper - 1,) + cell],
+                                  TINY))
+        return np.exp((1 - fraction) * below + fraction * above)
+
+    def digest(self):
+        """
+        Gibt den SHA-256 (hex) über den Inhalt der Tabelle zurück. Die
+        Transmission wird je mu-Stützstelle gelesen, eine per Memory-Map
+        geladene Tabelle also nie ganz in den Speicher geholt.
+        """
+        digest = hashlib.sha256()
+        digest.update(np.ascontiguousarray(self.mu, dtype=np.float64).
+                      tobytes())
+        digest.update(np.array([self.tan_max, self.pitch]).tobytes())
+        digest.update(str(self.transmission.shape).encode("utf-8"))
+        for plane in self.transmission:
+            digest.update(np.ascontiguousarray(plane, dtype=np.float32).
+                          tobytes())
+        return digest.hexdigest()
+
+    def save(self, path):
+        """
+        path: Zielverzeichnis.
+
+        Legt zusätzlich digest() ab, damit table_hash() die Tabelle nicht
+        erneut lesen muss.
+        """
+        tl.save({"mu": self.mu, "transmission": self.transmission,
+                 "tan_max": np.array(self.tan_max),
+                 "pitch": np.array(self.pitch),
+                 "digest": np.array(self.digest())}, path)
+
+def load(path):
+    """
+    Lädt eine gespeicherte Tabelle, die Transmission per Memory-Map.
+    """
+    stored = tl.load(path)
+    return response_table(stored["mu"], stored["transmission"],
+                          float(stored["tan_max"]), float(stored["pitch"]))
+
+def table_hash(path):
+    """
+    path: Verzeichnis einer gespeicherten Tabelle.
+
+    Gibt den beim Speichern abgelegten Inhaltshash zurück. Für Tabellen ohne
+    abgelegten Hash wird er aus dem Inhalt berechnet.
+    """
+    if os.path.exists(os.path.join(path, "digest.npy")):
+        return str(tl.load(path, keys=["digest"])["digest"])
+    return load(path).digest()
+
+def build(mu_min=1e-2, mu_max=10., n_mu=24, tan_max=2.5, n_tan=101,
+          n_pos=12, subsamples=2, steps=500, thickness=25., pitch=3.):
+    """
+    mu_min, mu_max, n_mu: Bereich und Anzahl der Stützstellen (1/mm). Unter-
+        halb von mu_min ist die Interpolation gegen T(0) = 1 praktisch exakt,
+        die Stützstellen werden für den Übergangsbereich gebraucht.
+    tan_max, n_tan: Tangentenbereich und Zellen je Achse. Der Default deckt
+        alle Bahnen aus der Wasserkugel auf die Kollimatorfläche ab.
+    n_pos: Zellen je Achse über eine Rasterweite.
+    subsamples: Stützstellen je Zelle und Achse für die Mittelung.
+    steps: Diskretisierung der Bahn wie in lead_length.
+    thickness: Kollimatordicke in x (mm), default 25.
+    pitch: Rasterweite (mm), default 3.
+
+    Gibt eine response_table zurück.
+    """
+    mu = np.logspace(np.log10(mu_min), np.log10(mu_max), n_mu)
+    tangent = -tan_max + (np.arange(n_tan*subsamples) + .5) * \
+        2*tan_max/(n_tan*subsamples)
+    position = (np.arange(n_pos*subsamples) + .5) * \
+        pitch/(n_pos*subsamples)
+    depth = thickness * (np.arange(steps) + 1.)/steps
+
+    # Luftschritte je Tangente und Position, in y und z identisch
+    air = mc.between_septa(np.reshape(position, (1,-1,1)) +
+        np.reshape(tangent, (-1,1,1)) * np.reshape(depth, (1,1,-1)))
+    air = np.reshape(air, (-1, steps)).astype(np.float32)
+    path = np.repeat(tangent**2, n_pos*subsamples)
+
+    rows = subsamples * n_pos * subsamples
+    transmission = np.zeros((n_mu, n_tan, n_tan, n_pos, n_pos),
+                            dtype=np.float32)
+    for cell in range(n_tan):
+        chunk = slice(cell*rows, (cell + 1)*rows)
+        lead = 1 - np.dot(air[chunk], air.T)/steps
+        lead *= thickness * np.sqrt(1 + np.reshape(path[chunk], (-1,1)) +
+                                    np.reshape(path, (1,-1)))
+        for index in range(n_mu):
+            mean = np.reshape(np.exp(-mu[index]*lead), (subsamples, n_pos,
+                subsamples, n_tan, subsamples, n_pos, subsamples)).\
+                mean(axis=(0,2,4,6))
+            transmission[index, cell] = np.transpose(mean, (1,0,2))
+    return response_table(mu, transmission, tan_max, pitch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=
+        "Transmissionstabelle des Kollimators berechnen und speichern.")
+    parser.add_argument("-o", "--output", default="kollimator")
+    parser.add_argument("--mu-min", type=float, default=1e-2)
+    parser.add_argument("--mu-max", type=float, default=10.)
+    parser.add_argument("--n-mu", type=int, default=24)
+    parser.add_argument("--tan-max", type=float, default=2.5)
+    parser.add_argument("--n-tan", type=int, default=101)
+    parser.add_argument("--n-pos", type=int, default=12)
+    parser.add_argument("--subsamples", type=int, default=2)
+    parser.add_argument("--steps", type=int, default=500)
+    arguments = parser.parse_args()
+
+    build(arguments.mu_min, arguments.mu_max, arguments.n_mu,
+          arguments.tan_max, arguments.n_tan, arguments.n_pos,
+          arguments.subsamples, arguments.steps).save(arguments.output)
+    print("Tabelle gespeichert in {0}".format(arguments.output))
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Verteilung eines großen Laufs auf mehrere Rechner ohne MPI. Ein Lauf wird
+durch ein Manifest (JSON) beschrieben, z.B.
+
+    {"histories": 100000000, "shards": 100, "seed": 1000, "W": 0.99}
+
+Erlaubte Einträge neben histories, shards und seed sind alle Argumente von
+mc_exp.simulate() (initial_energy, E, W, steps). Jeder Shard rechnet seinen
+Anteil an Historien und schreibt eine .npz-Datei mit Tally, Manifest, Shard-
+nummer und Startwert. Der Startwert wird, sofern nicht explizit angegeben,
+aus einem Hash über Manifest und Shardnummer abgeleitet. Verschiedene
+Manifeste (auch solche, die sich nur in seed unterscheiden) verwenden damit
+praktisch nie dieselben Zufallszahlenfolgen, anders als bei seed + Nummer.
+
+Die Dateien beliebig vieler Shards lassen sich anschließend zusammenfassen.
+Fehlende Shards verringern lediglich die Statistik. Als doppelt gilt eine
+Datei nur bei gleicher Shardnummer und gleichem Startwert; ein mit anderem
+Startwert wiederholter Shard ist unabhängig und wird mitgezählt.
+
+Aufruf:
+    python shard.py run manifest.json 7 [--seed S] [-o shard_7.npz]
+    python shard.py merge shard_*.npz [-o ergebnis]
+"""
+import json
+import hashlib
+import argparse
+import numpy as np
+import mc_exp as mc
+import tally as tl
+
+def load_manifest(path):
+    """
+    Liest ein Manifest und prüft die Pflichteinträge.
+    """
+    with open(path) as source:
+        manifest = json.load(source)
+    for name in ("histories", "shards", "seed"):
+        if name not in manifest:
+            raise ValueError("Manifest ohne Eintrag {0}.".format(name))
+    return manifest
+
+def shard_histories(manifest, index):
+    """
+    Anzahl der Historien für Shard index. Der Rest der Division wird auf
+    die ersten Shards verteilt.
+    """
+    share, rest = divmod(int(manifest["histories"]), int(manifest["shards"]))
+    return share + (index < rest)
+
+def shard_seed(manifest, index):
+    """
+    Startwert für Shard index: die ersten 32 Bit eines SHA-256 über das
+    kanonische Manifest und die Shardnummer (np.random.seed erlaubt nur
+    Werte unter 2**32).
+    """
+    described = json.dumps(manifest, sort_keys=True) + "/{0}".format(index)
+    return int(hashlib.sha256(described.encode("utf-8")).hexdigest()[:8], 16)
+
+def run_shard(manifest, index, seed=None, output=None):
+    """
+    manifest: Dictionary wie von load_manifest().
+    index: Shardnummer, 0 bis shards - 1.
+    seed: Startwert, default shard_seed(manifest, index).
+    output: Dateiname, default "shard_<index>.npz".
+
+    Rechnet den Shard und schreibt die Teilergebnisse. Gibt den Dateinamen
+    zurück.
+    """
+    if not 0 <= index < int(manifest["shards"]):
+        raise ValueError("Shard {0} liegt außerhalb des Manifests.".
+            format(index))
+    if seed is None:
+        seed = shard_seed(manifest, index)
+    if output is None:
+        output = "shard_{0}.npz".format(index)
+
+    options = dict((key, value) for key, value in manifest.items()
+                   if key not in ("histories", "shards", "seed"))
+    casino, timings = mc.simulate(shard_histories(manifest, index),
+                                  seed=seed, **options)
+
+    tally = casino.tally()
+    tally["manifest"] = np.array(json.dumps(manifest, sort_keys=True))
+    tally["shard"] = np.array(index)
+    tally["seed"] = np.array(seed)
+    tally["seconds"] = np.array(timings["total"])
+    np.savez(output, **tally)
+    return output
+
+def merge_shards(paths):
+    """
+    paths: Liste von Shard-Dateien.
+
+    Alle Dateien müssen zum selben Manifest gehören. Dateien mit gleicher
+    Shardnummer und gleichem Startwert werden nur einmal gezählt, fehlende
+    Shardnummern werden gemeldet. Gibt das zusammengefasste Tally sowie die
+    Liste der fehlenden Shardnummern zurück.
+    """
+    manifest = None
+    shards = {}
+    for path in paths:
+        with np.load(path) as data:
+            parts = dict((key, data[key]) for key in data.files)
+        described = str(parts.pop("manifest"))
+        if manifest is None:
+            manifest = described
+        elif described != manifest:
+            raise ValueError("{0} gehört zu einem anderen Manifest.".
+                format(path))
+
+        index = int(parts.pop("shard"))
+        seed = int(parts.pop("seed"))
+        parts.pop("seconds")
+        if (index, seed) in shards:
+            print("Shard {0} mit Startwert {1} doppelt, {2} wird ignoriert.".
+                format(index, seed, path))
+            continue
+        shards[index, seed] = parts
+
+    if not shards:
+        raise ValueError("Keine Shard-Dateien angegeben.")
+    present = set(index for index, seed in shards)
+    missing = [index for index in range(json.loads(manifest)["shards"])
+               if index not in present]
+    if missing:
+        print("Fehlende Shards: {0}".format(missing))
+    return tl.merge(shards.values()), missing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=
+        "Verteilte Läufe: Shards rechnen und zusammenfassen.")
+    commands = parser.add_subparsers(dest="command")
+
+    run = commands.add_parser("run", help="Einen Shard rechnen.")
+    run.add_argument("manifest")
+    run.add_argument("index", type=int)
+    run.add_argument("--seed", type=int, default=None)
+    run.add_argument("-o", "--output", default=None)
+
+    merge = commands.add_parser("merge", help="Shards zusammenfassen.")
+    merge.add_argument("shards", nargs="+")
+    merge.add_argument("-o", "--output", default=None,
+        help="Verzeichnis für das zusammengefasste Tally.")
+
+    arguments = parser.parse_args()
+    if arguments.command == "run":
+        print("Shard geschrieben: {0}".format(run_shard(
+            load_manifest(arguments.manifest), arguments.index,
+            arguments.seed, arguments.output)))
+    else:
+        tally, missing = merge_shards(arguments.shards)
+        q, dq = tl.results(tally)
+        print("Historien: {0}".format(int(tally["histories"])))
+        for i in range(4):
+            print("q{0} = {1:.3f} +- {2:.3f}%".format(i + 1, q[i], dq[i]))
+        if arguments.output:
+            tl.save(tally, arguments.output)
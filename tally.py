@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Hilfsfunktionen für Tallies, also die Rohdaten eines Laufs wie sie von
+mc_exp.tally() geliefert werden. Ein Tally ist ein Dictionary aus Numpy-
+Arrays, wobei sich die Einträge in zwei Gruppen aufteilen: Summen, die sich
+über mehrere Läufe einfach addieren lassen, und Bingrenzen, die bei allen
+zusammengefassten Läufen identisch sein müssen.
+
+Variablen
+SUMMED: Schlüssel, deren Einträge beim Zusammenfassen addiert werden.
+
+Funktionen
+results(): Berechnet q1 bis q4 samt Unsicherheit (Prozent).
+merge(): Fasst beliebig viele Tallies zu einem zusammen.
+save(): Schreibt ein Tally als Verzeichnis einzelner .npy-Dateien.
+load(): Lädt ein so gespeichertes Tally, wahlweise per Memory-Map.
+"""
+import os
+import numpy as np
+
+SUMMED = ("histories", "sums", "sumsq", "detector", "inner", "inner_sq",
+          "outer", "outer_sq", "dose")
+
+def results(tally):
+    """
+    tally: Dictionary wie von mc_exp.tally() zurückgegeben.
+
+    Jede Historie trägt genau einmal (mit Gewicht oder 0/1) zu jeder Frage
+    bei, daher ergibt sich die Unsicherheit des Mittelwerts direkt aus
+    Summe und Quadratsumme. Gibt die Arrays q und dq (jeweils Prozent,
+    ungerundet) zurück.
+    """
+    count = float(tally["histories"])
+    mean = tally["sums"]/count
+    variance = np.maximum(tally["sumsq"]/count - mean**2, 0)
+    return mean*100, np.sqrt(variance/count)*100
+
+def merge(tallies):
+    """
+    tallies: Liste von Tally-Dictionaries.
+
+    Addiert alle Einträge aus SUMMED, übrige Einträge (Bingrenzen) werden auf
+    Gleichheit geprüft und übernommen. Unterschiedliche Bingrenzen führen zu
+    einem ValueError.
+    """
+    tallies = list(tallies)
+    if not tallies:
+        raise ValueError("Keine Tallies zum Zusammenfassen.")
+
+    merged = {}
+    for key in tallies[0]:
+        if key in SUMMED:
+            merged[key] = np.sum([np.asarray(t[key]) for t in tallies],
+                                 axis=0)
+        else:
+            for t in tallies[1:]:
+                if not np.array_equal(t[key], tallies[0][key]):
+                    raise ValueError("{0} unterscheidet sich zwischen den "
+                                     "Tallies.".format(key))
+            merged[key] = np.array(tallies[0][key])
+    return merged
+
+def save(tally, path):
+    """
+    tally: Tally-Dictionary
+    path: Verzeichnis, wird bei Bedarf angelegt.
+
+    Jeder Eintrag landet als eigene .npy-Datei im Verzeichnis, sodass sich
+    einzelne Arrays später ohne Laden des Rests per Memory-Map öffnen lassen.
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    for key in tally:
+        np.save(os.path.join(path, key + ".npy"), np.asarray(tally[key]))
+
+def load(path, mmap=True, keys=None):
+    """
+    path: Verzeichnis eines mit save() geschriebenen Tallies.
+    mmap: Arrays nur einblenden statt einlesen, default True.
+    keys: Optionale Liste der zu ladenden Einträge, default alle.
+    """
+    if keys is None:
+        keys = [name[:-4] for name in os.listdir(path)
+                if name.endswith(".npy")]
+    mode = "r" if mmap else None
+    return dict((key, np.load(os.path.join(path, key + ".npy"),
+                              mmap_mode=mode)) for key in keys)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Tests für tally.py und archive.py. Aus dem Projektverzeichnis aufrufen, da
+mc_exp die Querschnittstabellen relativ dazu lädt.
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import numpy as np
+import mc_exp as mc
+import tally as tl
+import archive as ar
+import response as rs
+
+def test_merge_matches_combined_sums():
+    first = mc.simulate(2000, W=.99, steps=200, seed=1)[0].tally()
+    second = mc.simulate(3000, W=.99, steps=200, seed=2)[0].tally()
+    merged = tl.merge([first, second])
+
+    assert merged["histories"] == 5000
+    assert np.allclose(merged["sums"], first["sums"] + second["sums"])
+    assert np.allclose(merged["inner"], first["inner"] + second["inner"])
+    assert np.array_equal(merged["energy_edges"], first["energy_edges"])
+
+    q, dq = tl.results(merged)
+    assert np.allclose(q, (first["sums"] + second["sums"])/5000.*100)
+    assert np.all(dq > 0)
+
+def test_store_and_query():
+    path = tempfile.mkdtemp()
+    try:
+        casino, timings = mc.simulate(2000, W=.99, steps=200, seed=3)
+        runs = ar.archive(path)
+        run_id = runs.store(casino, timings, steps=200, seed=3)
+        runs.store(casino, timings, steps=200, seed=4)
+
+        rows = runs.query("seed = ?", (3,))
+        assert [row["id"] for row in rows] == [run_id]
+        assert rows[0]["histories"] == 2000
+        q, dq = tl.results(casino.tally())
+        assert np.allclose([rows[0]["q1"], rows[0]["q4"]], [q[0], q[3]])
+        assert rows[0]["t_total"] == timings["total"]
+
+        stored = runs.tally(run_id)
+        assert isinstance(stored["inner"], np.memmap)
+        assert np.array_equal(stored["inner"], casino.tally()["inner"])
+        assert len(runs.compare([1, 2])) == 2
+        runs.close()
+    finally:
+        shutil.rmtree(path)
+
+def test_response_and_dose_columns():
+    path = tempfile.mkdtemp()
+    try:
+        # Datenbank im alten Schema ohne response und dose_voxels
+        os.makedirs(os.path.join(path, "tallies"))
+        old = sqlite3.connect(os.path.join(path, "runs.sqlite"))
+        old.execute("CREATE TABLE runs (id INTEGER PRIMARY KEY "
+                    "AUTOINCREMENT, {0})".format(", ".join(
+                        ar.archive.columns[1:-2])))
+        old.commit()
+        old.close()
+
+        table = os.path.join(path, "tabelle")
+        rs.build(n_mu=4, n_tan=11, n_pos=3, steps=100).save(table)
+        runs = ar.archive(path)
+        plain = runs.store(*mc.simulate(1000, W=.99, steps=100, seed=1))
+        fast = runs.store(*mc.simulate(1000, W=.99, seed=1, dose_voxels=10,
+                                       response=table))
+
+        assert [row["id"] for row in runs.query("response IS NULL")] == \
+            [plain]
+        row = runs.query("response = ?", (rs.table_hash(table),))[0]
+        assert row["id"] == fast and row["dose_voxels"] == 10
+        runs.close()
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    test_merge_matches_combined_sums()
+    test_store_and_query()
+    test_response_and_dose_columns()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Tests für cache.py. Aus dem Projektverzeichnis aufrufen.
+"""
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+import cache as ch
+
+def entries(path):
+    return sorted(name for name in os.listdir(path)
+                  if not name.startswith("."))
+
+def test_hit_returns_same_tally():
+    path = tempfile.mkdtemp()
+    try:
+        runs = ch.run_cache(path)
+        miss = runs.run(2000, W=.99, steps=200, seed=1)
+        hit = runs.run(2e3, W=.99, steps=200., seed=1)
+        assert len(entries(path)) == 1
+        assert sorted(miss) == sorted(hit)
+        for key in miss:
+            assert type(miss[key]) is type(hit[key])
+            assert np.array_equal(miss[key], hit[key])
+
+        runs.run(2000, W=.99, steps=200, seed=2)
+        assert len(entries(path)) == 2
+    finally:
+        shutil.rmtree(path)
+
+def test_eviction_bounds_size():
+    path = tempfile.mkdtemp()
+    try:
+        runs = ch.run_cache(path, max_bytes=150000, stale_seconds=60)
+        first = runs.key(runs.parameters(2000, W=.99, steps=200, seed=1))
+        runs.run(2000, W=.99, steps=200, seed=1)
+        runs.run(2000, W=.99, steps=200, seed=2)
+        assert first not in entries(path)
+        assert len(entries(path)) == 1
+
+        # Liegengebliebene Staging-Verzeichnisse werden nach stale_seconds
+        # entfernt, frische zählen zur Größe.
+        stale = tempfile.mkdtemp(prefix=".tmp-", dir=path)
+        old = time.time() - 120
+        os.utime(stale, (old, old))
+        fresh = tempfile.mkdtemp(prefix=".tmp-", dir=path)
+        with open(os.path.join(fresh, "part.npy"), "wb") as part:
+            part.write(b"0"*150000)
+        runs.evict()
+        assert not os.path.exists(stale)
+        assert os.path.exists(fresh)
+        assert entries(path) == []
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    test_hit_returns_same_tally()
+    test_eviction_bounds_size()
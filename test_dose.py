@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Tests für dose.py und die Energiebilanz in particles.interact. Aus dem
+Projektverzeichnis aufrufen.
+"""
+import numpy as np
+import mc_exp as mc
+import dose as ds
+import tally as tl
+
+def energy_balance(W, histories=5000):
+    np.random.seed(1)
+    casino = mc.mc_exp(histories, 0.1405, 1e-3, W)
+    casino.dose = ds.dose_grid(20)
+    casino.particles.deposit = casino.dose.score
+    casino.out_of_water()
+    escaped = np.sum(casino.particles.weight * casino.particles.energy)
+    return np.sum(casino.dose.grid) + escaped, histories*0.1405
+
+def test_energy_balance_with_weight_cutoff():
+    deposited, emitted = energy_balance(.99)
+    assert abs(deposited - emitted) < 1e-9*emitted
+
+def test_energy_balance_with_energy_cutoff():
+    deposited, emitted = energy_balance(1e-2)
+    assert abs(deposited - emitted) < 1e-9*emitted
+
+def test_scoring_keeps_results_and_merges():
+    plain = mc.simulate(2000, W=.99, steps=200, seed=1)[0].tally()
+    scored = mc.simulate(2000, W=.99, steps=200, seed=1,
+                         dose_voxels=10)[0].tally()
+    assert np.array_equal(plain["sums"], scored["sums"])
+    assert scored["dose"].shape == (10, 10, 10)
+
+    merged = tl.merge([scored, scored])
+    assert np.allclose(merged["dose"], 2*scored["dose"])
+
+    grid = ds.dose_grid(10)
+    grid.score(np.array([[0., 0., 0.], [99., 99., 99.], [150., 0., 0.]]),
+               np.array([1., 2., 4.]))
+    assert grid.dense()[5, 5, 5] == 1 and grid.dense()[9, 9, 9] == 2
+    assert np.sum(grid.grid) == 3
+
+
+if __name__ == "__main__":
+    test_energy_balance_with_weight_cutoff()
+    test_energy_balance_with_energy_cutoff()
+    test_scoring_keeps_results_and_merges()
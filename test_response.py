@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Tests für response.py. Aus dem Projektverzeichnis aufrufen. Die Tabellen
+sind gröber als der Default, damit die Tests schnell bleiben.
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+import matplotlib.pyplot as plt
+import mc_exp as mc
+import response as rs
+import validate as vd
+import cache as ch
+
+GEOMETRY = {"n_tan": 41, "n_pos": 6, "steps": 200}
+
+class lead_like(mc.mc_exp):
+    """
+    Schwächt im Kollimator mit dem Photo-Querschnitt von Blei statt mit dem
+    von Wasser, also mit mu um 2 bis 5/mm statt nahe 0.
+    """
+    def poll_4(self, table=None):
+        self.particles.total_x = self.lead.interpolate(self.particles.energy,
+                                                       "photo")
+        mc.mc_exp.poll_4(self, table)
+
+def samples(count=20000):
+    random = np.random.RandomState(0)
+    direction = np.column_stack((np.ones(count),
+                                 random.uniform(-2.4, 2.4, (count, 2))))
+    return random.uniform(-50, 50, (count, 3)), direction
+
+def test_lookup_between_grid_points():
+    table = rs.build(**GEOMETRY)
+    position, direction = samples()
+    assert np.allclose(table.lookup(np.zeros(len(position)), position,
+                                    direction), 1)
+
+    # Vergleich mit Tabellen, die mu exakt als Stützstelle enthalten
+    for mu in (.05, .5, 2., 5.):
+        exact = rs.build(mu_min=mu, mu_max=mu, n_mu=1, **GEOMETRY)
+        mu = np.full(len(position), mu)
+        interpolated = table.lookup(mu, position, direction)
+        expected = exact.lookup(mu, position, direction)
+        assert abs(np.sum(interpolated)/np.sum(expected) - 1) < 1e-2
+        relevant = expected > 1e-3
+        assert np.all(np.abs(interpolated[relevant]/expected[relevant] - 1)
+                      < 3e-2)
+
+def test_table_matches_lead_length():
+    path = tempfile.mkdtemp()
+    try:
+        table = os.path.join(path, "tabelle")
+        rs.build(**GEOMETRY).save(table)
+        for experiment in (lead_like, mc.mc_exp):
+            report = vd.validate({"response": table, "experiment":
+                                  experiment}, {"experiment": experiment},
+                                 histories=5000, seeds=range(1, 6), W=.99)
+            assert report["passed"]
+            assert report["speedup"] > 1
+    finally:
+        shutil.rmtree(path)
+
+def test_plot_weights_spectra_with_transmission():
+    path = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        table = os.path.join(path, "tabelle")
+        rs.build(**GEOMETRY).save(table)
+        casino = mc.simulate(5000, W=.99, seed=1, experiment=lead_like,
+                             response=table)[0]
+        os.chdir(path)
+        casino.plot()
+        inner, outer = [sum(bar.get_height() for bar in
+                            plt.figure(number).axes[0].patches)
+                        for number in plt.get_fignums()[-2:]]
+        plt.close("all")
+        assert np.isclose(inner + outer, np.sum(casino.survivors))
+        assert inner + outer < np.sum(casino.survivors > 0)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path)
+
+def test_cache_key_follows_table_content():
+    path = tempfile.mkdtemp()
+    try:
+        table = os.path.join(path, "tabelle")
+        built = rs.build(n_mu=4, n_tan=11, n_pos=3, steps=100)
+        built.save(table)
+        assert rs.table_hash(table) == built.digest()
+        os.remove(os.path.join(table, "digest.npy"))
+        assert rs.table_hash(table) == built.digest()
+
+        runs = ch.run_cache(os.path.join(path, "cache"))
+        params = runs.parameters(1000, W=.99, response=table)
+        key = runs.key(params)
+        assert runs.key(params) == key
+        moved = os.path.join(path, "kopie")
+        shutil.copytree(table, moved)
+        assert runs.key(runs.parameters(1000, W=.99, response=moved)) == key
+        built.transmission[0, 0, 0, 0, 0] *= .5
+        built.save(table)
+        assert runs.key(params) != key
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    test_lookup_between_grid_points()
+    test_table_matches_lead_length()
+    test_plot_weights_spectra_with_transmission()
+    test_cache_key_follows_table_content()
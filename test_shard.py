@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Tests für shard.py. Aus dem Projektverzeichnis aufrufen.
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+import mc_exp as mc
+import tally as tl
+import shard as sh
+
+MANIFEST = {"histories": 6001, "shards": 3, "seed": 10, "W": .99,
+            "steps": 200}
+
+def test_shard_seeds_are_disjoint():
+    seeds = [sh.shard_seed(MANIFEST, index) for index in range(3)]
+    shifted = dict(MANIFEST, seed=11)
+    assert len(set(seeds)) == 3
+    assert not set(seeds) & set(sh.shard_seed(shifted, index)
+                                 for index in range(3))
+    assert all(0 <= seed < 2**32 for seed in seeds)
+
+def test_merged_shards_match_single_run():
+    path = tempfile.mkdtemp()
+    try:
+        files = [sh.run_shard(MANIFEST, index, output=os.path.join(path,
+                 "shard_{0}.npz".format(index))) for index in range(3)]
+        assert [sh.shard_histories(MANIFEST, i) for i in range(3)] == \
+            [2001, 2000, 2000]
+
+        # Ein Shard ist exakt ein Lauf mit seinem Startwert
+        single = mc.simulate(2001, W=.99, steps=200,
+                             seed=sh.shard_seed(MANIFEST, 0))[0].tally()
+        with np.load(files[0]) as data:
+            assert np.array_equal(data["sums"], single["sums"])
+            assert np.array_equal(data["inner"], single["inner"])
+
+        merged, missing = sh.merge_shards(files + [files[1]])
+        assert missing == []
+        assert merged["histories"] == 6001
+
+        # Gleiche Statistik wie ein einzelner Lauf über alle Historien
+        whole = mc.simulate(6001, W=.99, steps=200, seed=99)[0].tally()
+        q_merged, dq_merged = tl.results(merged)
+        q_whole, dq_whole = tl.results(whole)
+        assert np.all(np.abs(q_merged - q_whole) <
+                      4*np.sqrt(dq_merged**2 + dq_whole**2))
+        assert np.allclose(dq_merged, dq_whole, rtol=.2)
+
+        # Mit anderem Startwert wiederholter Shard zählt, fehlender wird
+        # gemeldet
+        rerun = sh.run_shard(MANIFEST, 1, seed=12345,
+                             output=os.path.join(path, "rerun.npz"))
+        merged, missing = sh.merge_shards([files[0], files[1], rerun])
+        assert missing == [2]
+        assert merged["histories"] == 6001
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    test_shard_seeds_are_disjoint()
+    test_merged_shards_match_single_run()
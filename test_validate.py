@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Tests für validate.py. Aus dem Projektverzeichnis aufrufen.
+"""
+import numpy as np
+import mc_exp as mc
+import validate as vd
+
+def test_identical_configuration_passes():
+    report = vd.validate({}, histories=2000, seeds=range(1, 6), W=.99,
+                         steps=200)
+    assert report["passed"]
+    assert np.all(report["z"] == 0)
+
+class biased(mc.mc_exp):
+    """
+    Kandidat mit 1 % Fehler in q2, der die Zufallszahlenfolge nicht
+    verändert, wie es bei einem fehlerhaften schnellen Pfad passieren kann.
+    """
+    def poll_2(self):
+        mc.mc_exp.poll_2(self)
+        self.sums[1] *= .99
+        self.sumsq[1] *= .99**2
+
+def test_paired_test_detects_small_bias():
+    # Bei 2000 Historien liegt 1 % von q2 innerhalb der unabhängigen
+    # Streuung, die gepaarten Läufe sehen den Fehler trotzdem.
+    report = vd.validate({"experiment": biased}, histories=2000,
+                         seeds=range(1, 6), W=.99, steps=200)
+    assert not report["passed"]
+    assert abs(report["z"][1]) > 3
+    assert abs(report["independent_z"][1]) < 3
+
+def test_tolerance_is_opt_in():
+    # Ohne Toleranz fällt der Fehler auf, eine Toleranz von 2 % verdeckt
+    # ihn und wird im Bericht vermerkt.
+    assert vd.validate({"experiment": biased}, histories=2000,
+                       seeds=range(1, 6), W=.99, steps=200)["tolerance"] == 0
+    report = vd.validate({"experiment": biased}, histories=2000,
+                         seeds=range(1, 6), W=.99, steps=200, tolerance=.02)
+    assert report["tolerance"] == .02
+    assert report["z"][1] == 0
+
+def test_diverging_candidate_fails():
+    report = vd.validate({"W": .95}, histories=2000, seeds=range(1, 6),
+                         W=.99, steps=200)
+    assert not report["passed"]
+
+def test_t_to_z_limits():
+    assert np.allclose(vd.t_to_z([0.], 4), 0)
+    assert np.isinf(vd.t_to_z([np.inf], 4)[0])
+    # Für viele Freiheitsgrade nähert sich t der Normalverteilung
+    assert abs(vd.t_to_z([2.], 1000)[0] - 2.) < 1e-2
+
+
+if __name__ == "__main__":
+    test_identical_configuration_passes()
+    test_paired_test_detects_small_bias()
+    test_tolerance_is_opt_in()
+    test_diverging_candidate_fails()
+    test_t_to_z_limits()
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Statistische Validierung beschleunigter Varianten gegen die Referenz-
+implementierung (particles/mc_exp in ihrer jetzigen Form). Beide Varianten
+laufen mit denselben Startwerten und Teilchenzahlen. Weil gleiche Start-
+werte die Ergebnisse stark korrelieren, wird gepaart getestet: jeder Start-
+wert ist eine Wiederholung, geprüft wird der Mittelwert der Differenzen
+von q1 bis q4 gegen deren Streuung über die Startwerte.
+
+Die Spektren werden nicht gepaart verglichen: je Bin hängt die Differenz
+oft an wenigen seltenen Ereignissen (z.B. analoges Auswürfeln gegen
+tabellierte Gewichte), deren Streuung zehn Startwerte nicht erfassen. Der
+t-Test je Bin wäre dann nicht kalibriert. Stattdessen läuft der Kandidat
+mit anderen Startwerten und wird unabhängig per z-Wert und per Chi-Quadrat
+mit den Quadratsummen der Gewichte verglichen. Der Geschwindigkeitsgewinn
+wird aus den gepaarten Läufen bestimmt.
+
+Optional lässt sich für den gepaarten Test eine relative Toleranz angeben,
+unterhalb derer Differenzen als null gelten (Äquivalenztest). Default ist 0,
+der Test prüft dann auf unveränderte Ergebnisse; eine gesetzte Toleranz
+erscheint im Bericht.
+
+Eine Konfiguration ist ein Dictionary mit Argumenten für mc_exp.simulate(),
+also z.B. {"steps": 500} oder {"experiment": schnelle_unterklasse}.
+
+Funktionen
+run(): Führt eine Konfiguration für alle Startwerte aus.
+t_to_z(): Rechnet t-Werte näherungsweise in Standardnormal-Werte um.
+paired_t(): t-Werte des Mittelwerts gepaarter Differenzen.
+paired_z(): Gepaarte z-Werte von q1 bis q4 über alle Startwerte.
+z_scores(): z-Werte der Differenz von q1 bis q4 zweier unabhängiger Tallies.
+side_variance(): Varianz eines Histogramms für chi_square().
+chi_square(): Chi-Quadrat-Vergleich zweier unabhängiger Histogramme.
+p_value(): Obere Wahrscheinlichkeit der Chi-Quadrat-Verteilung.
+validate(): Vergleicht Referenz und Kandidat, gibt Bericht aus.
+"""
+import math
+import time
+import numpy as np
+import mc_exp as mc
+import tally as tl
+
+def run(config, histories, seeds):
+    """
+    config: Dictionary mit Argumenten für mc_exp.simulate().
+    histories: Teilchenzahl je Startwert.
+    seeds: Liste der Startwerte.
+
+    Gibt die Liste der Tallies (ein Eintrag je Startwert) sowie die gesamte
+    Laufzeit (Sekunden) zurück.
+    """
+    tallies = []
+    duration = 0.
+    for seed in seeds:
+        start = time.time()
+        casino, timings = mc.simulate(histories, seed=seed, **config)
+        tallies.append(casino.tally())
+        duration += time.time() - start
+    return tallies, duration
+
+def t_to_z(t, df):
+    """
+    t: Array von t-Werten
+    df: Freiheitsgrade
+
+    Näherung nach Wallace, damit die gepaarten Tests ohne scipy mit den
+    Schwellen der Normalverteilung bzw. mit p_value() auskommen.
+    """
+    t = np.asarray(t, dtype=float)
+    z = np.sqrt(df*np.log1p(t**2/df)) * (8.*df + 1)/(8.*df + 3)
+    z[np.isinf(t)] = np.inf
+    return np.sign(t)*z
+
+def paired_t(differences, margin=0):
+    """
+    differences: (Startwerte, n)-Array der Differenzen Kandidat - Referenz.
+    margin: Betrag je Spalte, um den der Mittelwert in Richtung 0 verkürzt
+        wird, bevor durch seinen Fehler geteilt wird. Default 0.
+
+    Gibt die t-Werte des Mittelwerts je Spalte zurück. Ohne Streuung ist t
+    0 bei verschwindendem und unendlich bei endlichem Mittelwert.
+    """
+    count = differences.shape[0]
+    mean = np.mean(differences, axis=0)
+    mean = np.sign(mean)*np.maximum(np.abs(mean) - margin, 0)
+    error = np.std(differences, axis=0, ddof=1)/np.sqrt(count)
+    t = np.zeros_like(mean)
+    spread = error > 0
+    t[spread] = mean[spread]/error[spread]
+    t[~spread & (mean != 0)] = np.inf
+    return t
+
+def paired_z(reference, candidate, tolerance=0):
+    """
+    reference, candidate: Listen von Tallies mit gleichen Startwerten.
+    tolerance: Relative Toleranz bezogen auf den Referenzwert, default 0.
+        Differenzen bis zu dieser Größe gelten als null.
+
+    Gibt Array mit vier z-Werten für die Differenz von q1 bis q4 zurück.
+    """
+    q_ref = np.array([tl.results(ref)[0] for ref in reference])
+    q_can = np.array([tl.results(can)[0] for can in candidate])
+    margin = tolerance*np.abs(np.mean(q_ref, axis=0))
+    return t_to_z(paired_t(q_can - q_ref, margin), len(reference) - 1)
+
+def z_scores(reference, candidate):
+    """
+    reference, candidate: Tallies aus Läufen mit verschiedenen Startwerten.
+
+    Gibt Array mit vier z-Werten zurück.
+    """
+    q_ref, dq_ref = tl.results(reference)
+    q_can, dq_can = tl.results(candidate)
+    sigma = np.sqrt(dq_ref**2 + dq_can**2)
+    sigma[sigma == 0] = np.inf
+    return (q_can - q_ref)/sigma
+
+def side_variance(content, squares, histories, pooled):
+    """
+    content, squares: Histogramm und Quadratsummen einer Seite.
+    histories: Teilchenzahl dieser Seite.
+    pooled: Gemeinsamer Inhalt je Historie unter der Nullhypothese.
+
+    Varianz des auf die Teilchenzahl normierten Histogramms, siehe
+    chi_square().
+    """
+    total = np.sum(content)
+    weight = np.sum(squares)/total if total > 0 else 1.
+    return np.maximum(squares, weight*pooled*histories)/histories**2
+
+def chi_square(reference, candidate, key):
+    """
+    reference, candidate: Tallies aus Läufen mit verschiedenen Startwerten.
+    key: Name des Histogramms, z.B. "inner". Zu key muss ein Eintrag
+        key + "_sq" mit den Quadratsummen der Gewichte existieren.
+
+    Beide Histogramme werden auf die jeweilige Teilchenzahl normiert. Die
+    Varianz einer Seite ist ihre Quadratsumme, mindestens aber der unter der
+    Nullhypothese (gemeinsamer Mittelwert beider Läufe) erwartete Inhalt mal
+    dem mittleren Gewicht dieser Seite. Sonst erhielte ein Bin, in dem etwa
+    die ungewichtete Referenz zufällig leer ist, der Kandidat aber viele
+    kleine Gewichte hat, eine viel zu kleine Varianz. Berücksichtigt nur
+    Bins, in denen mindestens eine Seite Einträge hat. Gibt Chi-Quadrat und
+    Anzahl der Freiheitsgrade zurück.
+    """
+    n_ref = float(reference["histories"])
+    n_can = float(candidate["histories"])
+    difference = candidate[key]/n_can - reference[key]/n_ref
+    pooled = (candidate[key] + reference[key])/(n_ref + n_can)
+    variance = side_variance(reference[key], reference[key + "_sq"], n_ref,
+                             pooled) + \
+        side_variance(candidate[key], candidate[key + "_sq"], n_can, pooled)
+    used = variance > 0
+    return np.sum(difference[used]**2/variance[used]), int(np.sum(used))
+
+def p_value(chi2, ndf):
+    """
+    chi2: Chi-Quadrat-Wert
+    ndf: Anzahl Freiheitsgrade
+
+    Näherung nach Wilson-Hilferty, genügt für die hier üblichen Bin-
+    zahlen und erspart die Abhängigkeit von scipy.
+    """
+    if ndf == 0:
+        return 1.
+    if np.isinf(chi2):
+        return 0.
+    scale = 2./(9*ndf)
+    z = ((chi2/ndf)**(1./3) - (1 - scale))/math.sqrt(scale)
+    return .5*math.erfc(z/math.sqrt(2))
+
+def validate(candidate, reference=None, histories=1e5, seeds=range(1, 11),
+             independent=True, z_max=3., p_min=1e-3, tolerance=0,
+             **common):
+    """
+    candidate: Konfiguration der zu prüfenden Variante.
+    reference: Konfiguration der Referenz, default {} (mc_exp wie gehabt).
+    histories: Teilchenzahl je Startwert, default 1e5
+    seeds: Startwerte, identisch für beide Varianten, mindestens drei.
+    independent: Kandidat zusätzlich mit anderen Startwerten rechnen und
+        unabhängig vergleichen, default True. Ohne diese Läufe werden die
+        Spektren nicht geprüft.
+    z_max: Größter zulässiger Betrag der z-Werte, default 3
+    p_min: Kleinster zulässiger p-Wert der Spektrenvergleiche, default 1e-3
+    tolerance: Relative Toleranz des gepaarten Tests von q1 bis q4,
+        default 0 (keine).
+    common: Weitere Argumente für simulate(), die für beide Varianten
+        gelten (initial_energy, E, W...).
+
+    Gibt ein Dictionary mit den gepaarten (und ggf. unabhängigen) Ergeb-
+    nissen, dem Speedup und dem Gesamturteil unter "passed" zurück und
+    druckt einen Bericht.
+    """
+    seeds = list(seeds)
+    if len(seeds) < 3:
+        raise ValueError("Gepaarter Test braucht mindestens drei Startwerte.")
+    if reference is None:
+        reference = {}
+    reference = dict(common, **reference)
+    candidate = dict(common, **candidate)
+
+    ref_tallies, ref_time = run(reference, histories, seeds)
+    can_tallies, can_time = run(candidate, histories, seeds)
+
+    report = {"z": paired_z(ref_tallies, can_tallies, tolerance),
+              "tolerance": tolerance,
+              "speedup": ref_time/can_time if can_time else np.inf}
+    passed = bool(np.all(np.abs(report["z"]) <= z_max))
+
+    ref_tally = tl.merge(ref_tallies)
+    if independent:
+        other_seeds = [max(seeds) + 1 + i for i in range(len(seeds))]
+        other_tally = tl.merge(run(candidate, histories, other_seeds)[0])
+        report["independent_z"] = z_scores(ref_tally, other_tally)
+        report["independent_spectra"] = {}
+        passed = passed and \
+            bool(np.all(np.abs(report["independent_z"]) <= z_max))
+        for key in ("inner", "outer"):
+            chi2, ndf = chi_square(ref_tally, other_tally, key)
+            p = p_value(chi2, ndf)
+            report["independent_spectra"][key] = (chi2, ndf, p)
+            passed = passed and p >= p_min
+    report["passed"] = passed
+
+    q_ref = tl.results(ref_tally)[0]
+    q_can = tl.results(tl.merge(can_tallies))[0]
+    print("Validierung mit {0} Historien je Startwert, Startwerte {1}".
+        format(int(histories), seeds))
+    for i in range(4):
+        print("q{0}: Referenz {1:.3f}%, Kandidat {2:.3f}%, gepaart z = "
+            "{3:.2f}".format(i + 1, q_ref[i], q_can[i], report["z"][i]))
+    if tolerance:
+        print("Gepaarter Test mit Toleranz {0:g} (Differenzen darunter "
+            "gelten als null)".format(tolerance))
+    if independent:
+        print("Unabhängig (Startwerte {0}): z = {1}".format(other_seeds,
+            ", ".join("{0:.2f}".format(z) for z in report["independent_z"])))
+        for key in ("inner", "outer"):
+            print("Spektrum {0} unabhängig: chi2/ndf = {1:.1f}/{2}, "
+                "p = {3:.3g}".format(key, *report["independent_spectra"][key]))
+    print("Laufzeit Referenz {0:.1f} s, Kandidat {1:.1f} s, Speedup {2:.2f}".
+        format(ref_time, can_time, report["speedup"]))
+    print("Ergebnis: {0}".format("BESTANDEN" if passed else "DURCHGEFALLEN"))
+    return report
+
+
+if __name__ == "__main__":
+    # Beispiel: Gröbere Diskretisierung in lead_length als "schneller Pfad"
+    validate({"steps": 500}, histories=1e5, W=.99)